@@ -1,6 +1,7 @@
 #!/usr/bin/env bash
 CLI_LOCATION="$(pwd)/cli"
 echo "Building plugin in $(pwd)"
+$(pwd)/.vscode/vendor.sh || exit 1
 printf "Please input sudo password to proceed.\n"
 
 # read -s sudopass
@@ -0,0 +1,11 @@
+#!/usr/bin/env bash
+# Install the backend's Python dependencies into py_modules/, which decky puts on sys.path.
+# Wheels are picked for the loader's bundled interpreter and the Deck, not the build host.
+LOADER_PYTHON_VERSION="3.11"
+LOADER_PLATFORM="manylinux2014_x86_64"
+
+echo "Vendoring Python dependencies into $(pwd)/py_modules"
+python3 -m pip install --upgrade --no-compile --target py_modules \
+    --python-version "$LOADER_PYTHON_VERSION" --implementation cp \
+    --platform "$LOADER_PLATFORM" --only-binary=:all: \
+    -r requirements.txt
@@ -0,0 +1,282 @@
+/*
+ * airdecky-rtp: packetize an H.264 Annex-B stream read from stdin into
+ * RTP (RFC 6184) and send it to a receiver over UDP.
+ *
+ * Usage: airdecky-rtp <ip> <port> [fps] [mtu]
+ *
+ * The stream must carry access unit delimiters (ffmpeg's
+ * h264_metadata=aud=insert bitstream filter) so that every frame can be
+ * sent as sendmmsg(2) batches with the marker bit set on its last packet.
+ */
+#define _GNU_SOURCE
+#include <arpa/inet.h>
+#include <errno.h>
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/socket.h>
+#include <sys/uio.h>
+#include <time.h>
+#include <unistd.h>
+
+#define RTP_HEADER_SIZE 12
+#define FU_HEADER_SIZE 2
+#define RTP_PAYLOAD_TYPE 96
+#define RTP_CLOCK_RATE 90000
+#define NAL_TYPE_AUD 9
+#define NAL_TYPE_FU_A 28
+#define BATCH_SIZE 64
+#define READ_SIZE 65536
+#define INITIAL_BUFFER (1024 * 1024)
+#define MAX_BUFFER (8 * 1024 * 1024)
+
+struct rtp_sender {
+    int fd;
+    uint16_t seq;
+    uint32_t timestamp;
+    uint32_t timestamp_step;
+    uint32_t ssrc;
+    size_t max_payload;
+    unsigned int count;
+    struct mmsghdr msgs[BATCH_SIZE];
+    struct iovec iov[BATCH_SIZE][2];
+    uint8_t headers[BATCH_SIZE][RTP_HEADER_SIZE + FU_HEADER_SIZE];
+};
+
+/* Send every queued packet with as few sendmmsg calls as possible */
+static int flush_batch(struct rtp_sender *s) {
+    unsigned int sent = 0;
+
+    while (sent < s->count) {
+        int n = sendmmsg(s->fd, s->msgs + sent, s->count - sent, 0);
+        if (n < 0) {
+            if (errno == EINTR)
+                continue;
+            /* The receiver is not listening (yet); drop the rest of the frame */
+            if (errno == ECONNREFUSED)
+                break;
+            perror("sendmmsg");
+            return -1;
+        }
+        sent += n;
+    }
+    s->count = 0;
+    return 0;
+}
+
+/* Queue one RTP packet; the payload is referenced, not copied */
+static int queue_packet(struct rtp_sender *s, const uint8_t *payload, size_t len,
+                        const uint8_t *fu, int marker) {
+    unsigned int i;
+    uint8_t *h;
+    size_t header_len = RTP_HEADER_SIZE;
+
+    if (s->count == BATCH_SIZE && flush_batch(s) < 0)
+        return -1;
+
+    i = s->count++;
+    h = s->headers[i];
+    h[0] = 0x80;
+    h[1] = (marker ? 0x80 : 0x00) | RTP_PAYLOAD_TYPE;
+    h[2] = s->seq >> 8;
+    h[3] = s->seq & 0xff;
+    h[4] = s->timestamp >> 24;
+    h[5] = (s->timestamp >> 16) & 0xff;
+    h[6] = (s->timestamp >> 8) & 0xff;
+    h[7] = s->timestamp & 0xff;
+    h[8] = s->ssrc >> 24;
+    h[9] = (s->ssrc >> 16) & 0xff;
+    h[10] = (s->ssrc >> 8) & 0xff;
+    h[11] = s->ssrc & 0xff;
+    s->seq++;
+
+    if (fu) {
+        h[12] = fu[0];
+        h[13] = fu[1];
+        header_len += FU_HEADER_SIZE;
+    }
+
+    s->iov[i][0].iov_base = h;
+    s->iov[i][0].iov_len = header_len;
+    s->iov[i][1].iov_base = (void *)payload;
+    s->iov[i][1].iov_len = len;
+    memset(&s->msgs[i], 0, sizeof(s->msgs[i]));
+    s->msgs[i].msg_hdr.msg_iov = s->iov[i];
+    s->msgs[i].msg_hdr.msg_iovlen = 2;
+    return 0;
+}
+
+/* Send a NAL unit as a single packet, or as FU-A fragments if it exceeds the MTU */
+static int send_nal(struct rtp_sender *s, const uint8_t *nal, size_t len, int last) {
+    const uint8_t *p = nal + 1;
+    size_t remaining = len - 1;
+    size_t chunk_max = s->max_payload - FU_HEADER_SIZE;
+    uint8_t fu[2];
+    int start = 1;
+
+    if (len <= s->max_payload)
+        return queue_packet(s, nal, len, NULL, last);
+
+    fu[0] = (nal[0] & 0xe0) | NAL_TYPE_FU_A;
+    while (remaining > 0) {
+        size_t chunk = remaining < chunk_max ? remaining : chunk_max;
+        int end = chunk == remaining;
+
+        fu[1] = (start ? 0x80 : 0x00) | (end ? 0x40 : 0x00) | (nal[0] & 0x1f);
+        if (queue_packet(s, p, chunk, fu, last && end) < 0)
+            return -1;
+        p += chunk;
+        remaining -= chunk;
+        start = 0;
+    }
+    return 0;
+}
+
+/* Return the offset of the next 00 00 01 start code at or after from, or len */
+static size_t find_start_code(const uint8_t *buf, size_t from, size_t len) {
+    size_t i = from + 2;
+
+    while (i < len) {
+        const uint8_t *p = memchr(buf + i, 1, len - i);
+        if (!p)
+            return len;
+        i = p - buf;
+        if (buf[i - 1] == 0 && buf[i - 2] == 0)
+            return i - 2;
+        i++;
+    }
+    return len;
+}
+
+/* Packetize and send every NAL unit of one access unit, then advance the clock */
+static int send_access_unit(struct rtp_sender *s, const uint8_t *au, size_t len) {
+    const uint8_t *pending = NULL;
+    size_t pending_len = 0;
+    size_t pos = find_start_code(au, 0, len);
+
+    while (pos < len) {
+        size_t start = pos + 3;
+        size_t next = find_start_code(au, start, len);
+        size_t end = next;
+
+        /* Zero bytes before a start code belong to the start code, not the NAL */
+        while (end > start && au[end - 1] == 0)
+            end--;
+        if (end > start && (au[start] & 0x1f) != NAL_TYPE_AUD) {
+            if (pending && send_nal(s, pending, pending_len, 0) < 0)
+                return -1;
+            pending = au + start;
+            pending_len = end - start;
+        }
+        pos = next;
+    }
+
+    if (pending && send_nal(s, pending, pending_len, 1) < 0)
+        return -1;
+    if (flush_batch(s) < 0)
+        return -1;
+    s->timestamp += s->timestamp_step;
+    return 0;
+}
+
+int main(int argc, char **argv) {
+    static struct rtp_sender sender;
+    struct sockaddr_in addr;
+    uint8_t *buf;
+    size_t cap = INITIAL_BUFFER, len = 0, scan = 0;
+    int fps, mtu;
+
+    if (argc < 3) {
+        fprintf(stderr, "usage: %s <ip> <port> [fps] [mtu]\n", argv[0]);
+        return 2;
+    }
+    fps = argc > 3 ? atoi(argv[3]) : 30;
+    mtu = argc > 4 ? atoi(argv[4]) : 1400;
+    if (fps <= 0 || mtu <= RTP_HEADER_SIZE + FU_HEADER_SIZE + 1) {
+        fprintf(stderr, "invalid fps or mtu\n");
+        return 2;
+    }
+
+    memset(&addr, 0, sizeof(addr));
+    addr.sin_family = AF_INET;
+    addr.sin_port = htons(atoi(argv[2]));
+    if (inet_pton(AF_INET, argv[1], &addr.sin_addr) != 1) {
+        fprintf(stderr, "invalid address: %s\n", argv[1]);
+        return 2;
+    }
+
+    sender.fd = socket(AF_INET, SOCK_DGRAM, 0);
+    if (sender.fd < 0 || connect(sender.fd, (struct sockaddr *)&addr, sizeof(addr)) < 0) {
+        perror("socket");
+        return 1;
+    }
+    srandom(time(NULL) ^ getpid());
+    sender.seq = random() & 0xffff;
+    sender.timestamp = random();
+    sender.ssrc = random();
+    sender.timestamp_step = RTP_CLOCK_RATE / fps;
+    sender.max_payload = mtu - RTP_HEADER_SIZE;
+
+    buf = malloc(cap);
+    if (!buf) {
+        perror("malloc");
+        return 1;
+    }
+
+    for (;;) {
+        ssize_t n;
+
+        if (cap - len < READ_SIZE) {
+            if (cap < MAX_BUFFER) {
+                uint8_t *grown = realloc(buf, cap * 2);
+                if (!grown) {
+                    perror("realloc");
+                    return 1;
+                }
+                buf = grown;
+                cap *= 2;
+            } else {
+                /* No delimiter in sight; send what we have rather than grow forever */
+                if (send_access_unit(&sender, buf, len) < 0)
+                    return 1;
+                len = scan = 0;
+            }
+        }
+
+        n = read(STDIN_FILENO, buf + len, cap - len);
+        if (n < 0) {
+            if (errno == EINTR)
+                continue;
+            perror("read");
+            return 1;
+        }
+        if (n == 0)
+            break;
+        len += n;
+
+        /* Every access unit delimiter after the start of the buffer closes a frame */
+        for (;;) {
+            size_t sc = find_start_code(buf, scan, len);
+            if (sc + 3 >= len) {
+                /* Resume just before the tail so a split start code is still found */
+                scan = sc < len ? sc : (len > 2 ? len - 2 : 0);
+                break;
+            }
+            if (sc > 0 && (buf[sc + 3] & 0x1f) == NAL_TYPE_AUD) {
+                if (send_access_unit(&sender, buf, sc) < 0)
+                    return 1;
+                memmove(buf, buf + sc, len - sc);
+                len -= sc;
+                sc = 0;
+            }
+            scan = sc + 3;
+        }
+    }
+
+    if (len > 0 && send_access_unit(&sender, buf, len) < 0)
+        return 1;
+    free(buf);
+    close(sender.fd);
+    return 0;
+}
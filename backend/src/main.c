@@ -1,5 +0,0 @@
-#include <stdio.h>
-int main() {
-  printf("Hello World\n");
-  return 0;
-}
\ No newline at end of file
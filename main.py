@@ -1,68 +1,730 @@
 import os
-import subprocess
 import asyncio
 import socket
 import json
 import time
-import threading
-from typing import Optional, List, Dict
+import functools
+import glob
+import ipaddress
+import pwd
+import re
+from typing import Optional, List, Dict, Tuple
 import struct
-import tempfile
 
 # The decky plugin module is located at decky-loader/plugin
 # For easy intellisense checkout the decky-loader code repo
 # and add the `decky-loader/plugin/imports` path to `python.analysis.extraPaths` in `.vscode/settings.json`
 import decky
 
+# zeroconf is optional; when it is not bundled in py_modules we fall back to avahi-browse
+try:
+    from zeroconf import IPVersion, ServiceStateChange
+    from zeroconf.asyncio import AsyncServiceBrowser, AsyncServiceInfo, AsyncZeroconf
+    # zeroconf's own interface enumeration dependency, so it is bundled alongside it
+    import ifaddr
+except ImportError:
+    AsyncZeroconf = None
+
+AIRPLAY_SERVICE_TYPES = ["_airplay._tcp.local.", "_raop._tcp.local."]
+
+# External tools reported in the system info panel
+SYSTEM_TOOLS = ('ffmpeg', 'gst-launch-1.0', 'avahi-browse', 'wf-recorder', 'xwininfo')
+
+# PATH is tokenized once at import; the plugin never changes its own environment
+_PATH_DIRS = tuple(filter(None, os.environ.get('PATH', '').split(os.pathsep)))
+
+def _which(tool: str, _dirs=_PATH_DIRS) -> Optional[str]:
+    """Find an executable in the pre-split PATH"""
+    for directory in _dirs:
+        path = directory + '/' + tool
+        if os.access(path, os.X_OK) and os.path.isfile(path):
+            return path
+    return None
+
+@functools.lru_cache(maxsize=None)
+def _tool_path(tool: str) -> Optional[str]:
+    """Resolve a tool on PATH once, until get_system_info(refresh=True) clears the cache"""
+    return _which(tool)
+
+# Host details never change while the plugin is loaded
+_UNAME = os.uname()
+
+# The display the plugin was started under; the environment is not changed afterwards
+_DISPLAY = os.environ.get("DISPLAY")
+_WAYLAND_DISPLAY = os.environ.get("WAYLAND_DISPLAY")
+
+# Render node used for VA-API hardware encoding
+VAAPI_DEVICE = '/dev/dri/renderD128'
+
+# Without a GPU colour converter, frames are downloaded once and converted to 4:2:0 in a
+# single libswscale pass (its SIMD RGB->YUV kernels) before encoding
+SOFTWARE_CONVERT_FILTER = 'hwdownload,format=bgr0,scale=flags=fast_bilinear,format=yuv420p'
+
+# Input options, filter chain and codec options per encoder, in order of preference
+ENCODER_OPTIONS = {
+    'h264_nvenc': (
+        (),
+        'hwdownload,format=bgr0',
+        ('-c:v', 'h264_nvenc', '-preset', 'p1', '-tune', 'll', '-b:v', '8M'),
+    ),
+    # Frames stay on the GPU as DMA-BUFs from the KMS plane through the encoder
+    'h264_vaapi': (
+        ('-init_hw_device', f'vaapi=va:{VAAPI_DEVICE}'),
+        'hwmap=derive_device=vaapi,scale_vaapi=format=nv12',
+        # No B-frames: every frame can be decoded as soon as it arrives
+        ('-c:v', 'h264_vaapi', '-bf', '0', '-b:v', '8M'),
+    ),
+    'h264_v4l2m2m': (
+        (),
+        SOFTWARE_CONVERT_FILTER,
+        ('-c:v', 'h264_v4l2m2m', '-pix_fmt', 'yuv420p', '-b:v', '8M'),
+    ),
+    'libx264': (
+        (),
+        SOFTWARE_CONVERT_FILTER,
+        # Low-latency operating point: no B-frames or lookahead, 8-bit 4:2:0, baseline profile
+        (
+            '-c:v', 'libx264', '-preset', 'ultrafast', '-tune', 'zerolatency',
+            '-profile:v', 'baseline', '-pix_fmt', 'yuv420p',
+            '-x264-params', 'bframes=0:scenecut=0:rc-lookahead=0',
+            '-g', '60', '-b:v', '6M'
+        ),
+    ),
+}
+
+CAP_SYS_ADMIN = 21
+# Set by "+e": raise the permitted set into the effective set at exec
+VFS_CAP_FLAGS_EFFECTIVE = 0x000001
+
+def _has_sys_admin_cap(path: str) -> bool:
+    """Check whether a binary carries CAP_SYS_ADMIN as a file capability (setcap cap_sys_admin+ep)"""
+    try:
+        # vfs_cap_data: magic/flags, then the low 32 permitted capability bits
+        magic_etc, permitted = struct.unpack_from('<II', os.getxattr(path, 'security.capability'))
+    except (OSError, struct.error):
+        return False
+    # ffmpeg never raises capabilities itself, so a permitted-only grant gives it nothing
+    return bool(magic_etc & VFS_CAP_FLAGS_EFFECTIVE) and bool(permitted & (1 << CAP_SYS_ADMIN))
+
+# RTP packetizer built from backend/src and shipped in the plugin's bin directory
+RTP_HELPER = os.path.join(decky.DECKY_PLUGIN_DIR, 'bin', 'airdecky-rtp')
+# Receivers only hand out an RTP port in their RTSP SETUP reply, which is not negotiated yet, so the
+# packetizer is opt-in: set AIRDECKY_RTP_PORT to a UDP port the receiver listens on. Unset, every
+# capture path sends MPEG-TS to STREAM_URL
+_RTP_PORT_ENV = os.environ.get('AIRDECKY_RTP_PORT', '')
+RTP_PORT = int(_RTP_PORT_ENV) if _RTP_PORT_ENV.isdigit() else 0
+# Frame rate of the fused pipeline; the packetizer advances the RTP clock by one frame per access unit
+PIPELINE_FPS = 30
+
+def _build_pipeline_argv(encoder: str, rtp: bool = False) -> Tuple[str, ...]:
+    """Build the device-independent part of the ffmpeg capture/encode/stream command"""
+    input_args, video_filter, codec_args = ENCODER_OPTIONS[encoder]
+    if rtp:
+        # Raw Annex-B with access unit delimiters so the packetizer can find frame boundaries
+        output_args = ('-bsf:v', 'h264_metadata=aud=insert', '-f', 'h264', 'pipe:1')
+    else:
+        # The device URL is appended per stream; output is flushed once per muxed frame
+        # rather than held back until the I/O buffer fills
+        output_args = ('-flush_packets', '1', '-f', 'mpegts')
+    return (
+        'ffmpeg', '-hide_banner', '-nostats', '-loglevel', 'error',
+        *input_args,
+        '-framerate', str(PIPELINE_FPS),
+        '-f', 'kmsgrab', '-i', '-',
+        '-vf', video_filter,
+        *codec_args,
+        *output_args
+    )
+
+def _build_pipewire_argv(rtp: bool = False) -> Tuple[str, ...]:
+    """Build the device-independent part of the GStreamer command that encodes gamescope's PipeWire stream"""
+    # gamescope publishes its composited output as a DMA-BUF PipeWire node named "gamescope"
+    caps = 'video/x-raw(memory:VAMemory),format=NV12'
+    rate = ()
+    if rtp:
+        # The node delivers frames at a variable rate up to the display's refresh, but the packetizer
+        # timestamps access units at a fixed rate, so frames are duplicated or dropped to match it
+        caps += f',framerate={PIPELINE_FPS}/1'
+        rate = ('!', 'videorate')
+    argv = (
+        'gst-launch-1.0', '-q',
+        'pipewiresrc', 'target-object=gamescope', 'do-timestamp=true',
+        '!', 'vapostproc',
+        *rate,
+        '!', caps,
+        '!', 'vah264enc', 'aud=true', 'bitrate=8000',
+        '!', 'h264parse',
+    )
+    if rtp:
+        return argv + ('!', 'video/x-h264,stream-format=byte-stream,alignment=au', '!', 'fdsink', 'fd=1')
+    # The sink host and port are appended per stream; alignment=7 hands the sink seven whole
+    # 188-byte TS packets per buffer
+    return argv + ('!', 'mpegtsmux', 'alignment=7', '!', 'tcpclientsink', 'sync=false')
+
+def _pipewire_elements(rtp: bool = False) -> Tuple[str, ...]:
+    """GStreamer elements the matching _build_pipewire_argv variant links together"""
+    if rtp:
+        return ('pipewiresrc', 'vapostproc', 'videorate', 'vah264enc', 'h264parse', 'fdsink')
+    return ('pipewiresrc', 'vapostproc', 'vah264enc', 'h264parse', 'mpegtsmux', 'tcpclientsink')
+
+# Fallback capture commands for desktop sessions. Each muxes MPEG-TS and writes it to the
+# device socket itself, so no relay process copies the stream; the target is appended per stream
+WF_RECORDER_CAPTURE = (
+    'wf-recorder',
+    '-m', 'mpegts',
+    '-c', 'h264_vaapi',  # Use hardware encoding if available
+    '--pixel-format', 'yuv420p'
+)
+GST_WAYLAND_CAPTURE = (
+    'gst-launch-1.0',
+    'waylandsrc',
+    '!', 'videoconvert',
+    '!', 'x264enc', 'speed-preset=ultrafast', 'tune=zerolatency',
+    '!', 'h264parse',
+    '!', 'mpegtsmux', 'alignment=7',
+    '!', 'tcpclientsink', 'sync=false'
+)
+# Start emitting frames at once instead of probing and buffering the grab first
+LOW_LATENCY_INPUT = ('-fflags', 'nobuffer', '-flags', 'low_delay', '-probesize', '32', '-analyzeduration', '0')
+X11_CAPTURE = (
+    'ffmpeg', '-hide_banner', '-nostats', '-loglevel', 'error',
+    *LOW_LATENCY_INPUT,
+    '-f', 'x11grab',
+    '-s', '1280x800',  # Steam Deck resolution
+    '-r', '30',        # 30 FPS
+    '-i', ':0.0',      # X11 display
+    '-c:v', 'libx264',
+    '-preset', 'ultrafast',
+    '-tune', 'zerolatency',
+    '-pix_fmt', 'yuv420p',
+    # Constant bitrate and a fixed one-second GOP keep the receiver's decode buffer shallow
+    '-b:v', '6M', '-maxrate', '6M', '-bufsize', '3M',
+    '-x264-params', 'nal-hrd=cbr:force-cfr=1:keyint=30:min-keyint=30:scenecut=0',
+    '-flush_packets', '1',
+    '-f', 'mpegts'
+)
+# Same grab, with frames uploaded once and encoded on the GPU's fixed-function block
+X11_VAAPI_CAPTURE = (
+    'ffmpeg', '-hide_banner', '-nostats', '-loglevel', 'error',
+    '-vaapi_device', VAAPI_DEVICE,
+    *LOW_LATENCY_INPUT,
+    '-f', 'x11grab',
+    '-s', '1280x800',
+    '-r', '30',
+    '-i', ':0.0',
+    '-vf', 'format=nv12,hwupload',
+    '-c:v', 'h264_vaapi',
+    '-bf', '0',
+    '-qp', '24',
+    '-g', '30',
+    '-flush_packets', '1',
+    '-f', 'mpegts'
+)
+
+# MPEG-TS target for every non-RTP path: raw TCP without Nagle delay and with a deep send buffer.
+# This won't work with real AirPlay devices but demonstrates the concept
+STREAM_URL = 'tcp://{ip}:7000?tcp_nodelay=1&send_buffer_size=2097152'
+
+def _session_env() -> Dict[str, str]:
+    """Environment that lets root-run tools reach the desktop user's PipeWire daemon"""
+    runtime_dir = f"/run/user/{pwd.getpwnam(decky.DECKY_USER).pw_uid}"
+    return {**os.environ, 'XDG_RUNTIME_DIR': runtime_dir, 'PIPEWIRE_RUNTIME_DIR': runtime_dir}
+
+async def _run_command(argv: List[str], timeout: float = 5, env: Optional[Dict[str, str]] = None) -> Tuple[int, str]:
+    """Run a command without blocking the event loop and return its exit code and stdout"""
+    proc = await asyncio.create_subprocess_exec(
+        *argv,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL,
+        env=env
+    )
+    try:
+        stdout, _ = await asyncio.wait_for(proc.communicate(), timeout=timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        raise
+    return proc.returncode, stdout.decode(errors='replace')
+
+async def _terminate_process(proc, timeout: float = 0.5):
+    """Ask a child to exit, killing it if it is still running after timeout, without blocking the loop"""
+    # Encoders only need a moment to flush; a stream toggle should not hang on a slow muxer
+    try:
+        proc.terminate()
+        await asyncio.wait_for(proc.wait(), timeout=timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+    except ProcessLookupError:
+        pass
+
+async def _drain_stderr(proc, tag: str):
+    """Log a child's stderr as it arrives so a full pipe can never stall it"""
+    # The streaming children are told to print errors only, so whatever arrives is worth a warning.
+    # Read in chunks: ffmpeg's progress stats end in \r, so line reads would hit the limit and stop draining
+    while chunk := await proc.stderr.read(4096):
+        decky.logger.warning(f"{tag}: {chunk.decode(errors='replace').rstrip()}")
+
+async def _spawn_drained(argv, tag: str, **kwargs):
+    """Start a long-running child with stderr routed to the log; stdout is discarded unless redirected"""
+    kwargs.setdefault('stdout', asyncio.subprocess.DEVNULL)
+    proc = await asyncio.create_subprocess_exec(*argv, stderr=asyncio.subprocess.PIPE, **kwargs)
+    return proc, asyncio.create_task(_drain_stderr(proc, tag))
+
+async def _exited_early(procs, timeout: float = 0.5) -> bool:
+    """Give freshly started children a moment and report whether any of them has already quit"""
+    # A child exits straight away when its capture source, encoder or target cannot be opened
+    waits = [asyncio.ensure_future(proc.wait()) for proc in procs]
+    done, pending = await asyncio.wait(waits, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+    for wait in pending:
+        wait.cancel()
+    return bool(done)
+
+# Ports AirPlay receivers commonly listen on
+AIRPLAY_PORTS = (7000, 5000, 32498)
+
+# Kernel routes for directly attached subnets: "<cidr> dev <ifname> ... src <address> [linkdown]"
+_LINK_ROUTE = re.compile(r'^(\d+\.\d+\.\d+\.\d+/\d+)\s.*?\bdev\s+(\S+).*?\bsrc\s+(\S+).*$', re.M)
+# The first default route is the one with the lowest metric
+_DEFAULT_ROUTE = re.compile(r'^default\s.*?\bdev\s+(\S+)', re.M)
+
+# Larger subnets are swept only around our own address, which keeps the sweep to a /22
+MAX_SCAN_PREFIX = 22
+
+# Zero-timeout linger: closing a probe sends RST, so sweeps leave no TIME_WAIT sockets behind
+_LINGER_RESET = struct.pack('ii', 1, 0)
+
+# Device sets change over minutes, so fallback scan results are reused this long
+SCAN_CACHE_TTL = 60
+
+async def _probe_port(ip: str, port: int, timeout: float) -> Optional[bool]:
+    """Check whether a TCP connection to ip:port can be opened without blocking the loop
+
+    Returns None when the attempt timed out, as opposed to False for a refusal or other error,
+    so callers can retry only the failures that may be transient.
+    """
+    # A bare non-blocking connect skips the transport and stream objects open_connection would
+    # build (and their extra selector registrations and sockopt calls) for a socket we close at once
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setblocking(False)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, _LINGER_RESET)
+    try:
+        await asyncio.wait_for(asyncio.get_running_loop().sock_connect(sock, (ip, port)), timeout=timeout)
+        return True
+    except asyncio.TimeoutError:
+        return None
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+# Connects to a receiver on the LAN either succeed within milliseconds or not at all, so
+# user-facing checks fail fast and retry briefly instead of waiting out one long timeout
+CONNECT_TIMEOUT = 0.5
+CONNECT_RETRIES = 2
+CONNECT_BACKOFF = 0.1
+
+async def _retry(attempt, retries: int = CONNECT_RETRIES, backoff: float = CONNECT_BACKOFF):
+    """Await attempt() until it returns something other than None, backing off exponentially between tries"""
+    # Attempts return None for a timeout; a refusal is a definite answer and is not retried
+    result = None
+    for n in range(retries + 1):
+        result = await attempt()
+        if result is not None:
+            break
+        if n < retries:
+            await asyncio.sleep(backoff * 2 ** n)
+    return result
+
+async def _first_open_port(ip: str, timeout: float, retries: int = 0,
+                           limit: Optional[asyncio.Semaphore] = None) -> Optional[int]:
+    """Probe the common AirPlay ports at once and return the first one that accepts a connection"""
+    async def attempt(port: int) -> bool:
+        if limit is None:
+            return await _probe_port(ip, port, timeout)
+        async with limit:
+            return await _probe_port(ip, port, timeout)
+
+    async def probe(port: int) -> Optional[int]:
+        return port if await _retry(functools.partial(attempt, port), retries) else None
+
+    probes = [asyncio.ensure_future(probe(port)) for port in AIRPLAY_PORTS]
+    try:
+        for result in asyncio.as_completed(probes):
+            port = await result
+            if port is not None:
+                return port
+    finally:
+        for task in probes:
+            task.cancel()
+    return None
+
+async def _http_status(ip: str, port: int, path: str, timeout: float) -> Optional[int]:
+    """Send a minimal HTTP GET over an asyncio stream and return the response status code"""
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout=timeout)
+    except (OSError, asyncio.TimeoutError):
+        return None
+
+    try:
+        writer.write(
+            f"GET {path} HTTP/1.1\r\nHost: {ip}:{port}\r\n"
+            "User-Agent: AirPlay/1.0\r\nConnection: close\r\n\r\n".encode()
+        )
+        status_line = await asyncio.wait_for(reader.readline(), timeout=timeout)
+        parts = status_line.split()
+        if len(parts) >= 2 and parts[1].isdigit():
+            return int(parts[1])
+        return None
+    except (OSError, asyncio.TimeoutError):
+        return None
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+
+# Ethertype ARP, then an Ethernet/IPv4 ARP request's fixed fields
+ARP_REQUEST_HEADER = struct.pack('!HHHBBH', 0x0806, 1, 0x0800, 6, 4, 1)
+
+async def _arp_sweep(ifname: str, src_ip: str, targets: List[str], timeout: float) -> set:
+    """Broadcast one ARP request per target on a raw socket and collect the addresses that reply"""
+    sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(0x0806))
+    sock.setblocking(False)
+    try:
+        sock.bind((ifname, 0))
+        mac = sock.getsockname()[4]
+        sender = mac + socket.inet_aton(src_ip) + b'\x00' * 6
+        header = b'\xff' * 6 + mac + ARP_REQUEST_HEADER
+        wanted = set(targets)
+        loop = asyncio.get_running_loop()
+        for ip in targets:
+            await loop.sock_sendall(sock, header + sender + socket.inet_aton(ip))
+
+        alive = set()
+        deadline = loop.time() + timeout
+        while len(alive) < len(wanted):
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                frame = await asyncio.wait_for(loop.sock_recv(sock, 64), timeout=remaining)
+            except asyncio.TimeoutError:
+                break
+            # Ethertype ARP, opcode reply; the sender protocol address sits at offset 28
+            if len(frame) >= 42 and frame[12:14] == b'\x08\x06' and frame[20:22] == b'\x00\x02':
+                ip = socket.inet_ntoa(frame[28:32])
+                if ip in wanted:
+                    alive.add(ip)
+        return alive
+    finally:
+        sock.close()
+
+async def _neighbor_sweep(targets: List[str], timeout: float) -> set:
+    """Without raw sockets, nudge the kernel into resolving each target and read its ARP table"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setblocking(False)
+    try:
+        for ip in targets:
+            try:
+                # The discard port; only the ARP resolution the datagram triggers matters
+                sock.sendto(b'', (ip, 9))
+            except OSError:
+                pass
+        await asyncio.sleep(timeout)
+    finally:
+        sock.close()
+
+    wanted = set(targets)
+    alive = set()
+    with open('/proc/net/arp') as arp:
+        next(arp)
+        for line in arp:
+            fields = line.split()
+            # ATF_COM: the neighbour answered and has a hardware address
+            if len(fields) >= 4 and int(fields[2], 16) & 0x2 and fields[0] in wanted:
+                alive.add(fields[0])
+    return alive
+
+_AVAHI_ESCAPE = re.compile(rb'\\(\d{3}|.)')
+
+def _avahi_unescape(name: bytes) -> str:
+    """Undo avahi-browse's \\DDD (decimal) and \\X escaping of service names"""
+    if b'\\' in name:
+        name = _AVAHI_ESCAPE.sub(
+            lambda m: bytes([int(m.group(1))]) if len(m.group(1)) == 3 else m.group(1),
+            name
+        )
+    return name.decode(errors='replace')
+
+def _service_display_name(name: str, service_type: str) -> str:
+    """Strip the service type suffix (and RAOP's MAC prefix) from an mDNS instance name"""
+    suffix = "." + service_type
+    if name.endswith(suffix):
+        name = name[:-len(suffix)]
+    # RAOP instances are advertised as "<MAC>@<device name>"; other names may contain "@" themselves
+    if service_type == "_raop._tcp.local.":
+        name = name.split('@', 1)[-1]
+    return name
+
+class AirplayDevice:
+    __slots__ = ('name', 'ip', 'port')
+
+    def __init__(self, name: str, ip: str, port: int = 7000):
+        self.name = name
+        self.ip = ip
+        self.port = port
+
+    def to_dict(self) -> Dict[str, str]:
+        return {"name": self.name, "ip": self.ip, "type": "AirPlay Device"}
+
+def _ipv4_addresses() -> frozenset:
+    """The IPv4 addresses of every interface, the set zeroconf binds its sockets to"""
+    return frozenset(
+        (adapter.name, ip.ip)
+        for adapter in ifaddr.get_adapters()
+        for ip in adapter.ips
+        if isinstance(ip.ip, str)
+    )
+
+def _record_hash(info) -> int:
+    """Fingerprint the parts of a resolved service the device cache depends on"""
+    return hash((tuple(info.parsed_addresses(IPVersion.V4Only)), info.port, frozenset(info.properties.items())))
+
 class MDNSDiscovery:
     """Simple mDNS discovery for AirPlay devices"""
     
     def __init__(self):
-        self.devices = {}
-        
-    async def discover_airplay_devices(self, timeout: int = 5) -> List[Dict[str, str]]:
+        # Devices reported by the zeroconf browser, keyed by IP so the AirPlay and
+        # RAOP records of one receiver share an entry
+        self.devices: Dict[str, AirplayDevice] = {}
+        # Dict form of devices handed to the frontend, rebuilt only after the cache changes
+        self._snapshot: Optional[List[Dict[str, str]]] = None
+        self._service_ips: Dict[str, str] = {}
+        # Fingerprint of the records each service was last resolved from
+        self._record_hashes: Dict[str, int] = {}
+        self._zc = None
+        self._browser = None
+        # Interface addresses the browser's sockets were opened on
+        self._addresses: frozenset = frozenset()
+        self._resolve_tasks = set()
+        self._resolving = set()
+        self._last_change = 0.0
+        # Results of the last avahi/network scan, served until they expire
+        self._cache: Optional[List[Dict[str, str]]] = None
+        self._cache_expiry = 0.0
+        self._evict_task: Optional[asyncio.Task] = None
+        # Caps concurrent probe sockets so a sweep stays well under the FD limit
+        self._probe_limit = asyncio.Semaphore(64)
+
+    async def start(self) -> bool:
+        """Browse for AirPlay services in-process; we never run our own responder"""
+        if AsyncZeroconf is None:
+            return False
+        # zeroconf never rescans interfaces, so remember which ones its sockets cover
+        self._addresses = _ipv4_addresses()
+        self._zc = AsyncZeroconf()
+        self._browser = AsyncServiceBrowser(
+            self._zc.zeroconf,
+            AIRPLAY_SERVICE_TYPES,
+            handlers=[self._on_service_state_change]
+        )
+        self._last_change = time.monotonic()
+        return True
+
+    async def close(self):
+        """Stop browsing and release the mDNS sockets"""
+        if self._evict_task is not None:
+            self._evict_task.cancel()
+            self._evict_task = None
+        await self._stop_browser()
+
+    async def _stop_browser(self):
+        """Cancel the browser and its pending resolves and close the zeroconf instance"""
+        for task in list(self._resolve_tasks):
+            task.cancel()
+        if self._browser is not None:
+            await self._browser.async_cancel()
+            self._browser = None
+        if self._zc is not None:
+            await self._zc.async_close()
+            self._zc = None
+
+    async def _follow_network_changes(self):
+        """Restart the browser when interfaces or addresses changed since it was started"""
+        # Wi-Fi often connects after the plugin loads, and the Deck moves between networks
+        if _ipv4_addresses() == self._addresses:
+            return
+        decky.logger.info("Network interfaces changed, restarting mDNS browser")
+        await self._stop_browser()
+        self.devices.clear()
+        self._service_ips.clear()
+        self._record_hashes.clear()
+        self._snapshot = None
+        await self.start()
+
+    def _on_service_state_change(self, zeroconf, service_type: str, name: str, state_change) -> None:
+        """Handle AirPlay service add/update/remove events from the zeroconf browser"""
+        if state_change is ServiceStateChange.Updated and name in self._record_hashes:
+            # Receivers re-announce often; if the cached records match what we stored, skip the query
+            info = AsyncServiceInfo(service_type, name)
+            if info.load_from_cache(zeroconf) and _record_hash(info) == self._record_hashes[name]:
+                return
+
+        self._last_change = time.monotonic()
+        if state_change is ServiceStateChange.Removed:
+            self._forget_service(name)
+            return
+
+        # A name already resolved, or being resolved, needs no second query when it is re-added
+        if name in self._resolving or (state_change is ServiceStateChange.Added and name in self._service_ips):
+            return
+
+        self._resolving.add(name)
+        task = asyncio.ensure_future(self._resolve_service(zeroconf, service_type, name))
+        self._resolve_tasks.add(task)
+        task.add_done_callback(self._resolve_tasks.discard)
+        task.add_done_callback(lambda _: self._resolving.discard(name))
+
+    async def _resolve_service(self, zeroconf, service_type: str, name: str):
+        """Resolve an announced service to an address and store it in the device cache"""
+        try:
+            info = AsyncServiceInfo(service_type, name)
+            if not await info.async_request(zeroconf, 3000):
+                return
+
+            addresses = info.parsed_addresses(IPVersion.V4Only)
+            if not addresses:
+                return
+
+            ip = addresses[0]
+            if self._service_ips.get(name, ip) != ip:
+                self._forget_service(name)
+            self._service_ips[name] = ip
+
+            display_name = _service_display_name(name, service_type)
+            port = info.port or 7000
+            device = self.devices.get(ip)
+            if device is None:
+                self.devices[ip] = AirplayDevice(display_name, ip, port)
+                self._snapshot = None
+            elif service_type == AIRPLAY_SERVICE_TYPES[0]:
+                # Repeat announcements update in place; the AirPlay record wins over RAOP
+                if device.name != display_name:
+                    device.name = display_name
+                    self._snapshot = None
+                device.port = port
+            self._record_hashes[name] = _record_hash(info)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            decky.logger.error(f"Error resolving {name}: {e}")
+        finally:
+            self._last_change = time.monotonic()
+
+    def _forget_service(self, name: str) -> None:
+        """Drop a service and its device once no other service points at that IP"""
+        self._record_hashes.pop(name, None)
+        ip = self._service_ips.pop(name, None)
+        if ip is not None and ip not in self._service_ips.values():
+            if self.devices.pop(ip, None) is not None:
+                self._snapshot = None
+
+    async def _wait_quiet(self, timeout: float, quiet: float = 0.3):
+        """Return once announcements and resolves have been idle for `quiet` seconds"""
+        deadline = time.monotonic() + timeout
+        while True:
+            now = time.monotonic()
+            idle = now - self._last_change
+            if (idle >= quiet and not self._resolve_tasks) or now >= deadline:
+                return
+            await asyncio.sleep(min(max(quiet - idle, 0.05), deadline - now))
+
+    async def discover_airplay_devices(self, timeout: int = 5, force: bool = False) -> List[Dict[str, str]]:
         """Discover AirPlay devices using mDNS"""
+        if self._zc is not None:
+            await self._follow_network_changes()
+            # The browser keeps the cache current; only wait out announcements still landing
+            await self._wait_quiet(min(timeout, 2))
+            if self.devices:
+                if self._snapshot is None:
+                    self._snapshot = [device.to_dict() for device in self.devices.values()]
+                # Shared with later callers; decky only serialises it
+                return self._snapshot
+            # Nothing has answered the browser; avahi or the sweep may still find a receiver
+
+        if not force and self._cache is not None and time.monotonic() < self._cache_expiry:
+            self._schedule_eviction()
+            return list(self._cache)
+
         try:
             # Use avahi-browse if available (common on Linux systems)
-            result = subprocess.run([
-                'avahi-browse', '-t', '-r', '_airplay._tcp'
-            ], capture_output=True, text=True, timeout=timeout)
+            devices = await asyncio.wait_for(self._browse_avahi(), timeout=timeout)
             
-            if result.returncode == 0:
-                return self._parse_avahi_output(result.stdout)
-            else:
+            if devices is None:
                 # Fallback to network scanning
-                return await self._network_scan()
+                devices = await self._network_scan()
                 
-        except (subprocess.TimeoutExpired, FileNotFoundError):
+        except (asyncio.TimeoutError, FileNotFoundError):
             decky.logger.warning("avahi-browse not available, using network scan")
-            return await self._network_scan()
-    
-    def _parse_avahi_output(self, output: str) -> List[Dict[str, str]]:
-        """Parse avahi-browse output to extract device information"""
-        devices = []
-        lines = output.split('\n')
-        
-        current_device = {}
-        for line in lines:
-            line = line.strip()
-            if line.startswith('=') and '_airplay._tcp' in line:
-                parts = line.split()
-                if len(parts) >= 4:
-                    current_device = {
-                        'name': parts[3].replace('\\032', ' '),
-                        'type': 'AirPlay Device'
-                    }
-            elif line.startswith('address') and current_device:
-                # Extract IP address
-                parts = line.split('[')
-                if len(parts) > 1:
-                    ip = parts[1].split(']')[0]
-                    current_device['ip'] = ip
-                    devices.append(current_device.copy())
-                    current_device = {}
-                    
+            devices = await self._network_scan()
+
+        # An empty result is not worth holding on to; the next scan may catch a slow receiver
+        if devices:
+            self._cache = devices
+            self._cache_expiry = time.monotonic() + SCAN_CACHE_TTL
         return devices
+
+    def _schedule_eviction(self) -> None:
+        """Check cached devices in the background so ghosts drop out before a stream is attempted"""
+        if self._evict_task is None or self._evict_task.done():
+            self._evict_task = asyncio.create_task(self._evict_unreachable())
+
+    async def _evict_unreachable(self):
+        """Drop devices from the fallback scan cache that no longer answer on any AirPlay port"""
+        # Only the TTL'd fallback cache; the zeroconf browser tracks its own services' lifetimes
+        try:
+            ips = [d["ip"] for d in self._cache or ()]
+            results = await asyncio.gather(*(self._is_reachable(ip) for ip in ips))
+            dead = {ip for ip, alive in zip(ips, results) if not alive}
+            if not dead:
+                return
+            decky.logger.info(f"Evicting unreachable devices: {sorted(dead)}")
+            if self._cache is not None:
+                self._cache = [d for d in self._cache if d["ip"] not in dead]
+        except Exception as e:
+            decky.logger.error(f"Error checking cached devices: {e}")
+    
+    async def _browse_avahi(self) -> Optional[List[Dict[str, str]]]:
+        """Collect resolved services from avahi-browse's parsable output as it streams in"""
+        proc = await asyncio.create_subprocess_exec(
+            'avahi-browse', '-p', '-t', '-r', '_airplay._tcp',
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        # Name per address; avahi repeats a service once per interface it was seen on
+        found: Dict[str, str] = {}
+        try:
+            async for line in proc.stdout:
+                record = self._parse_avahi_record(line)
+                if record:
+                    found.setdefault(record[1], record[0])
+            if await proc.wait() != 0:
+                return None
+            return [{'name': name, 'ip': ip, 'type': 'AirPlay Device'} for ip, name in found.items()]
+        finally:
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+    
+    def _parse_avahi_record(self, line: bytes) -> Optional[Tuple[str, str]]:
+        """Parse one avahi-browse -p record, e.g. =;eth0;IPv4;Name;_airplay._tcp;local;host;ip;port;txt"""
+        parts = line.split(b';', 9)
+        # Only resolved ("=") IPv4 records carry an address we can connect to
+        if len(parts) < 9 or parts[0] != b'=' or parts[2] != b'IPv4':
+            return None
+        return _avahi_unescape(parts[3]), parts[7].decode()
     
     async def _network_scan(self) -> List[Dict[str, str]]:
         """Fallback network scanning for AirPlay devices"""
@@ -70,16 +732,17 @@ class MDNSDiscovery:
         
         try:
             # Get local network range
-            result = subprocess.run(['ip', 'route', 'show'], capture_output=True, text=True)
-            network_range = self._extract_network_range(result.stdout)
+            _, route_output = await _run_command(['ip', 'route', 'show'])
+            network = self._extract_network_range(route_output)
             
-            if network_range:
-                # Scan common AirPlay ports
-                tasks = []
-                for i in range(1, 255):
-                    ip = f"{network_range}.{i}"
-                    tasks.append(self._check_airplay_device(ip))
-                
+            if network:
+                subnet, src_ip, ifname = network
+                candidates = [ip for ip in map(str, subnet.hosts()) if ip != src_ip]
+                hosts = await self._live_hosts(candidates, src_ip, ifname)
+                decky.logger.info(f"{len(hosts)} live hosts on {subnet}")
+
+                # Scan common AirPlay ports on hosts that answered ARP
+                tasks = [self._check_airplay_device(ip) for ip in hosts]
                 results = await asyncio.gather(*tasks, return_exceptions=True)
                 devices = [r for r in results if isinstance(r, dict)]
                 
@@ -88,58 +751,72 @@ class MDNSDiscovery:
             
         return devices
     
-    def _extract_network_range(self, route_output: str) -> Optional[str]:
-        """Extract network range from ip route output"""
-        for line in route_output.split('\n'):
-            if 'src' in line and '192.168' in line:
-                parts = line.split()
-                for i, part in enumerate(parts):
-                    if part == 'src' and i + 1 < len(parts):
-                        ip = parts[i + 1]
-                        return '.'.join(ip.split('.')[:-1])
-        return None
+    def _extract_network_range(self, route_output: str) -> Optional[Tuple[ipaddress.IPv4Network, str, str]]:
+        """Extract the local subnet, our address on it and its interface from ip route output"""
+        # Routes are listed by prefix, so bridges like docker0 or a VPN would otherwise come first;
+        # the LAN is the subnet on the interface the default route leaves through
+        default = _DEFAULT_ROUTE.search(route_output)
+        default_dev = default.group(1) if default else None
+        first = None
+        for match in _LINK_ROUTE.finditer(route_output):
+            if 'linkdown' in match.group(0).split():
+                continue
+            cidr, dev, src_ip = match.groups()
+            try:
+                subnet = ipaddress.IPv4Network(cidr, strict=False)
+            except ValueError:
+                continue
+            if not subnet.is_private or subnet.is_loopback or subnet.is_link_local:
+                continue
+            if subnet.prefixlen < MAX_SCAN_PREFIX:
+                subnet = ipaddress.IPv4Network(f"{src_ip}/{MAX_SCAN_PREFIX}", strict=False)
+            if dev == default_dev:
+                return subnet, src_ip, dev
+            if first is None:
+                first = subnet, src_ip, dev
+        return first
+
+    async def _live_hosts(self, candidates: List[str], src_ip: str, ifname: str) -> List[str]:
+        """Narrow the sweep to hosts present on the link so only they get TCP probes"""
+        try:
+            alive = await _arp_sweep(ifname, src_ip, candidates, 1.0)
+            return [ip for ip in candidates if ip in alive]
+        except (OSError, AttributeError) as e:
+            decky.logger.debug(f"Raw ARP sweep unavailable: {e}")
+        try:
+            alive = await _neighbor_sweep(candidates, 1.0)
+            return [ip for ip in candidates if ip in alive]
+        except OSError as e:
+            decky.logger.warning(f"Neighbour sweep failed, probing every host: {e}")
+            return candidates
     
     async def _check_airplay_device(self, ip: str) -> Optional[Dict[str, str]]:
         """Check if an IP has an AirPlay service"""
         try:
-            # Try to connect to common AirPlay ports
-            for port in [7000, 5000, 32498]:
-                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                sock.settimeout(1)
-                result = sock.connect_ex((ip, port))
-                sock.close()
-                
-                if result == 0:
-                    # Try to get device info via HTTP
-                    device_info = await self._get_device_info(ip)
-                    if device_info:
-                        return device_info
-                        
+            if await self._is_reachable(ip):
+                # Try to get device info via HTTP
+                return await self._get_device_info(ip)
         except Exception:
             pass
         return None
+
+    async def _is_reachable(self, ip: str) -> bool:
+        """Try the common AirPlay ports at once; the first one to answer is enough"""
+        return await _first_open_port(ip, 1.0, limit=self._probe_limit) is not None
     
     async def _get_device_info(self, ip: str) -> Optional[Dict[str, str]]:
         """Try to get device information via HTTP"""
         try:
-            # Try common AirPlay info endpoints
-            import urllib.request
-            
-            for port in [7000, 5000]:
-                try:
-                    url = f"http://{ip}:{port}/server-info"
-                    req = urllib.request.Request(url)
-                    req.add_header('User-Agent', 'AirPlay/1.0')
-                    
-                    with urllib.request.urlopen(req, timeout=2) as response:
-                        if response.status == 200:
-                            return {
-                                'name': f"AirPlay Device ({ip})",
-                                'ip': ip,
-                                'type': 'AirPlay Device'
-                            }
-                except:
-                    continue
+            # Query the common AirPlay info endpoints concurrently
+            statuses = await asyncio.gather(
+                *[_http_status(ip, port, '/server-info', 2.0) for port in (7000, 5000)]
+            )
+            if 200 in statuses:
+                return {
+                    'name': f"AirPlay Device ({ip})",
+                    'ip': ip,
+                    'type': 'AirPlay Device'
+                }
                     
         except Exception:
             pass
@@ -150,49 +827,50 @@ class ScreenCapture:
     
     def __init__(self):
         self.capture_process = None
+        self._stderr_task: Optional[asyncio.Task] = None
         self.is_capturing = False
+        # Set by the plugin once encoder probing has found a working VA-API encoder
+        self.vaapi = False
+        # Encoder of the running capture, reported to the UI
+        self.encoder: Optional[str] = None
         
     async def check_capture_available(self) -> bool:
         """Check if screen capture is available"""
-        # Check for various capture tools
-        tools = ['ffmpeg', 'gstreamer-launch-1.0', 'wlr-randr', 'xwininfo']
-        available_tools = {}
-        
-        for tool in tools:
-            result = subprocess.run(['which', tool], capture_output=True, text=True)
-            available_tools[tool] = result.returncode == 0
-            
         # We need at least ffmpeg or gstreamer
-        has_capture = available_tools.get('ffmpeg', False) or available_tools.get('gstreamer-launch-1.0', False)
+        has_capture = _tool_path('ffmpeg') is not None or _tool_path('gst-launch-1.0') is not None
         
         if not has_capture:
             decky.logger.warning("No screen capture tools found")
             return False
             
         # Check display environment
-        display_env = os.environ.get("DISPLAY")
-        wayland_display = os.environ.get("WAYLAND_DISPLAY")
-        
-        if not display_env and not wayland_display:
+        if not _DISPLAY and not _WAYLAND_DISPLAY:
             decky.logger.warning("No display environment detected")
             return False
             
         return True
     
-    async def start_capture(self, output_file: str) -> bool:
-        """Start screen capture to file"""
+    async def start_capture(self, device_ip: str) -> bool:
+        """Start screen capture, streaming MPEG-TS straight to the device"""
         try:
             if self.is_capturing:
                 await self.stop_capture()
                 
             # Determine capture method based on environment
-            if os.environ.get("WAYLAND_DISPLAY"):
-                success = await self._start_wayland_capture(output_file)
-            elif os.environ.get("DISPLAY"):
-                success = await self._start_x11_capture(output_file)
+            if _WAYLAND_DISPLAY:
+                success = await self._start_wayland_capture(device_ip)
+            elif _DISPLAY:
+                success = await self._start_x11_capture(device_ip)
             else:
                 decky.logger.error("No supported display environment")
                 return False
+
+            if success and await _exited_early((self.capture_process,)):
+                decky.logger.error(f"Screen capture exited with code {self.capture_process.returncode}")
+                # The drainer reaches EOF once it has logged why
+                await asyncio.wait((self._stderr_task,), timeout=0.5)
+                await self.stop_capture()
+                return False
                 
             self.is_capturing = success
             return success
@@ -201,34 +879,20 @@ class ScreenCapture:
             decky.logger.error(f"Error starting capture: {e}")
             return False
     
-    async def _start_wayland_capture(self, output_file: str) -> bool:
+    async def _start_wayland_capture(self, device_ip: str) -> bool:
         """Start Wayland screen capture"""
         try:
             # Try wf-recorder first (if available)
-            if subprocess.run(['which', 'wf-recorder'], capture_output=True).returncode == 0:
-                cmd = [
-                    'wf-recorder',
-                    '-f', output_file,
-                    '-c', 'h264_vaapi',  # Use hardware encoding if available
-                    '--pixel-format', 'yuv420p'
-                ]
+            if _tool_path('wf-recorder'):
+                cmd = WF_RECORDER_CAPTURE + ('-f', STREAM_URL.format(ip=device_ip))
+                encoder = 'h264_vaapi'
             else:
                 # Fallback to gstreamer with waylandsink
-                cmd = [
-                    'gst-launch-1.0',
-                    'waylandsrc',
-                    '!', 'videoconvert',
-                    '!', 'x264enc', 'speed-preset=ultrafast', 'tune=zerolatency',
-                    '!', 'h264parse',
-                    '!', 'mp4mux',
-                    '!', 'filesink', f'location={output_file}'
-                ]
+                cmd = GST_WAYLAND_CAPTURE + (f'host={device_ip}', 'port=7000')
+                encoder = 'x264enc'
             
-            self.capture_process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
-            )
+            self.capture_process, self._stderr_task = await _spawn_drained(cmd, 'capture')
+            self.encoder = encoder
             
             return True
             
@@ -236,29 +900,13 @@ class ScreenCapture:
             decky.logger.error(f"Wayland capture error: {e}")
             return False
     
-    async def _start_x11_capture(self, output_file: str) -> bool:
+    async def _start_x11_capture(self, device_ip: str) -> bool:
         """Start X11 screen capture"""
         try:
-            # Use ffmpeg for X11 capture
-            cmd = [
-                'ffmpeg',
-                '-f', 'x11grab',
-                '-s', '1280x800',  # Steam Deck resolution
-                '-r', '30',        # 30 FPS
-                '-i', ':0.0',      # X11 display
-                '-c:v', 'libx264',
-                '-preset', 'ultrafast',
-                '-tune', 'zerolatency',
-                '-pix_fmt', 'yuv420p',
-                '-y',
-                output_file
-            ]
-            
-            self.capture_process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
-            )
+            # Use ffmpeg for X11 capture, encoding on the GPU when VA-API works
+            cmd = (X11_VAAPI_CAPTURE if self.vaapi else X11_CAPTURE) + (STREAM_URL.format(ip=device_ip),)
+            self.capture_process, self._stderr_task = await _spawn_drained(cmd, 'capture')
+            self.encoder = 'h264_vaapi' if self.vaapi else 'libx264'
             
             return True
             
@@ -270,96 +918,62 @@ class ScreenCapture:
         """Stop screen capture"""
         if self.capture_process:
             try:
-                self.capture_process.terminate()
-                # Wait for process to end
-                self.capture_process.wait(timeout=5)
-            except subprocess.TimeoutExpired:
-                self.capture_process.kill()
+                await _terminate_process(self.capture_process)
             finally:
+                # Nothing more worth logging; stop the drainer instead of waiting for its EOF
+                if self._stderr_task is not None:
+                    self._stderr_task.cancel()
                 self.capture_process = None
+                self._stderr_task = None
                 self.is_capturing = False
-
-class AirplayDevice:
-    def __init__(self, name: str, ip: str, port: int = 7000):
-        self.name = name
-        self.ip = ip
-        self.port = port
-        self.connected = False
-
-class AirplayStreamer:
-    """Handle AirPlay streaming protocol"""
-    
-    def __init__(self):
-        self.streaming = False
-        self.stream_process = None
-        
-    async def start_stream(self, device_ip: str, video_file: str) -> bool:
-        """Start streaming video file to AirPlay device"""
-        try:
-            # This is a simplified implementation
-            # Real AirPlay requires RTSP protocol implementation
-            
-            # For now, we'll use ffmpeg to stream via HTTP
-            # This won't work with real AirPlay devices but demonstrates the concept
-            cmd = [
-                'ffmpeg',
-                '-re',  # Read input at native frame rate
-                '-i', video_file,
-                '-c:v', 'copy',  # Copy video codec
-                '-c:a', 'copy',  # Copy audio codec
-                '-f', 'mpegts',  # Transport stream format
-                f'http://{device_ip}:7000/stream'  # Stream to device
-            ]
-            
-            self.stream_process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
-            )
-            
-            self.streaming = True
-            decky.logger.info(f"Started streaming to {device_ip}")
-            return True
-            
-        except Exception as e:
-            decky.logger.error(f"Error starting stream: {e}")
-            return False
-    
-    async def stop_stream(self):
-        """Stop the current stream"""
-        if self.stream_process:
-            try:
-                self.stream_process.terminate()
-                self.stream_process.wait(timeout=5)
-            except subprocess.TimeoutExpired:
-                self.stream_process.kill()
-            finally:
-                self.stream_process = None
-                self.streaming = False
+                self.encoder = None
 
 class Plugin:
     def __init__(self):
-        self.airplay_devices: List[AirplayDevice] = []
         self.streaming = False
         self.current_device: Optional[AirplayDevice] = None
         self.mdns_discovery = MDNSDiscovery()
         self.screen_capture = ScreenCapture()
-        self.airplay_streamer = AirplayStreamer()
-        self.temp_video_file = None
+        self._kms_capture = False
+        self._pipewire_capture = False
+        self._pipewire_env: Optional[Dict[str, str]] = None
+        self._rtp_helper = False
+        # Usable H.264 encoders, best first; probed once in _main
+        self._encoders: List[str] = ['libx264']
+        self._ff_proc = None
+        self._rtp_proc = None
+        # Drainers logging the pipeline children's stderr
+        self._stderr_tasks: List[asyncio.Task] = []
+        self._static_info: Optional[Dict[str, any]] = None
+        self._emit_task: Optional[asyncio.Task] = None
+        # Encoder used by the running pipeline, reported to the UI
+        self._stream_encoder: Optional[str] = None
+        # Pipeline commands specialised per (encoder, rtp) so a stream start only adds the device
+        self._argv_templates: Dict[Tuple[str, bool], Tuple[str, ...]] = {}
+        self._rtsp_conns: Dict[str, Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = {}
+        self._pending_state: Optional[Dict[str, any]] = None
+
+    # Coalesce streaming status updates into one UI event per loop iteration
+    def _schedule_emit(self, state: Dict[str, any]) -> None:
+        """Queue a streaming_status_changed event; only the latest state is sent"""
+        self._pending_state = state
+        if self._emit_task is None or self._emit_task.done():
+            self._emit_task = asyncio.create_task(self._flush_emit())
+
+    async def _flush_emit(self):
+        """Send the most recent pending streaming state to the frontend"""
+        await asyncio.sleep(0)
+        # A state queued while an emit is in flight finds this task still running; pick it up here
+        while self._pending_state is not None:
+            state, self._pending_state = self._pending_state, None
+            await decky.emit("streaming_status_changed", state)
 
     # Scan for AirPlay devices on the network
-    async def scan_airplay_devices(self) -> List[Dict[str, str]]:
+    async def scan_airplay_devices(self, force: bool = False) -> List[Dict[str, str]]:
         """Scan for AirPlay devices using mDNS discovery"""
         try:
             decky.logger.info("Scanning for AirPlay devices...")
-            devices = await self.mdns_discovery.discover_airplay_devices()
-            
-            if not devices:
-                # Add some mock devices for testing if none found
-                decky.logger.info("No real devices found, adding test devices")
-                devices = [
-                    {"name": "Test Apple TV", "ip": "192.168.1.100", "type": "AppleTV (Test)"},
-                ]
+            devices = await self.mdns_discovery.discover_airplay_devices(force=force)
             
             decky.logger.info(f"Found {len(devices)} AirPlay devices")
             return devices
@@ -368,10 +982,191 @@ class Plugin:
             decky.logger.error(f"Error scanning for devices: {e}")
             return []
 
+    # Detect hardware encoding support
+    async def _probe_vaapi(self) -> bool:
+        """Check for a VA-API render node that vainfo can initialise"""
+        if not os.path.exists(VAAPI_DEVICE):
+            return False
+        if not _tool_path('vainfo'):
+            return True
+
+        try:
+            returncode, _ = await _run_command(['vainfo', '--display', 'drm', '--device', VAAPI_DEVICE])
+            return returncode == 0
+        except (OSError, asyncio.TimeoutError):
+            return False
+
+    # Detect V4L2 memory-to-memory encoders (e.g. on ARM SoCs)
+    def _has_v4l2m2m_encoder(self) -> bool:
+        """Check video4linux device names for a hardware encoder"""
+        for name_file in glob.glob('/sys/class/video4linux/video*/name'):
+            try:
+                with open(name_file) as f:
+                    if 'enc' in f.read().lower():
+                        return True
+            except OSError:
+                continue
+        return False
+
+    # Rank the available encoders once so stream starts never probe ffmpeg
+    async def _probe_encoders(self) -> List[str]:
+        """Return the usable H.264 encoders ordered by throughput"""
+        available = {
+            'h264_nvenc': os.path.exists('/dev/nvidia0') and _tool_path('nvidia-smi') is not None,
+            'h264_vaapi': await self._probe_vaapi(),
+            'h264_v4l2m2m': self._has_v4l2m2m_encoder(),
+            'libx264': True,
+        }
+        ffmpeg = _tool_path('ffmpeg')
+        if ffmpeg is not None:
+            # A device is no use if this ffmpeg build lacks the matching encoder
+            try:
+                _, listing = await _run_command([ffmpeg, '-hide_banner', '-encoders'])
+                for encoder in available:
+                    available[encoder] = available[encoder] and f' {encoder} ' in listing
+            except (OSError, asyncio.TimeoutError) as e:
+                decky.logger.warning(f"Could not list ffmpeg encoders: {e}")
+        return [encoder for encoder in ENCODER_OPTIONS if available[encoder]] or ['libx264']
+
+    # Detect gamescope's PipeWire output and the GStreamer elements needed to encode it
+    async def _probe_pipewire_capture(self, rtp: bool) -> bool:
+        """Check whether the zero-copy PipeWire capture path can be used"""
+        if not all(_tool_path(tool) for tool in ('gst-launch-1.0', 'gst-inspect-1.0', 'pw-dump')):
+            return False
+
+        try:
+            # The element checks and the node dump are independent; let them run side by side
+            self._pipewire_env = _session_env()
+            results = await asyncio.gather(
+                *(_run_command(['gst-inspect-1.0', '--exists', element])
+                  for element in _pipewire_elements(rtp)),
+                _run_command(['pw-dump'], env=self._pipewire_env)
+            )
+            if any(returncode != 0 for returncode, _ in results):
+                return False
+            output = results[-1][1]
+            return any(
+                (obj.get('info') or {}).get('props', {}).get('node.name') == 'gamescope'
+                for obj in json.loads(output)
+            )
+        except (OSError, KeyError, ValueError, asyncio.TimeoutError) as e:
+            decky.logger.warning(f"PipeWire capture probe failed: {e}")
+            return False
+
+    # Specialise the pipeline command for the active capture source and encoder
+    def _pipeline_template(self, rtp: bool) -> Tuple[str, ...]:
+        """Return the cached device-independent pipeline command"""
+        encoder = 'vah264enc' if self._pipewire_capture else self._encoders[0]
+        key = (encoder, rtp)
+        template = self._argv_templates.get(key)
+        if template is None:
+            if self._pipewire_capture:
+                template = _build_pipewire_argv(rtp)
+            else:
+                template = _build_pipeline_argv(encoder, rtp)
+            self._argv_templates[key] = template
+        return template
+
+    # Resolve the pipeline command for a device
+    def _pipeline_argv(self, device_ip: str, rtp: bool) -> Tuple[str, ...]:
+        """Return the capture/encode/stream command targeting the device"""
+        template = self._pipeline_template(rtp)
+        if rtp:
+            return template
+        if self._pipewire_capture:
+            return (*template, f'host={device_ip}', 'port=7000')
+        return (*template, STREAM_URL.format(ip=device_ip))
+
+    # Maintain persistent RTSP control connections to streaming devices
+    async def _open_rtsp_connection(self, device_ip: str):
+        """Open and remember the TCP control connection to a device's AirPlay port"""
+        async def attempt():
+            try:
+                return await asyncio.wait_for(asyncio.open_connection(device_ip, 7000), timeout=CONNECT_TIMEOUT)
+            except asyncio.TimeoutError:
+                return None
+            except OSError:
+                return False
+
+        conn = await _retry(attempt)
+        if conn:
+            self._rtsp_conns[device_ip] = conn
+        else:
+            decky.logger.warning(f"Could not open control connection to {device_ip}")
+
+    async def _close_rtsp_connections(self):
+        """Close every open control connection"""
+        conns, self._rtsp_conns = self._rtsp_conns, {}
+        for _, writer in conns.values():
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+    # Start the fused capture/encode/stream pipeline
+    async def _start_pipeline(self, device_ip: str) -> bool:
+        """Launch one process that captures, encodes and streams the display to the device"""
+        use_rtp = self._rtp_helper
+        argv = self._pipeline_argv(device_ip, use_rtp)
+        env = self._pipewire_env if self._pipewire_capture else None
+        self._stream_encoder = 'vah264enc' if self._pipewire_capture else self._encoders[0]
+
+        if use_rtp:
+            # The encoder writes H.264 straight into the packetizer; no frame passes through Python
+            read_fd, write_fd = os.pipe()
+            try:
+                self._rtp_proc, task = await _spawn_drained(
+                    (RTP_HELPER, device_ip, str(RTP_PORT), str(PIPELINE_FPS)), 'rtp', stdin=read_fd
+                )
+                self._stderr_tasks.append(task)
+                self._ff_proc, task = await _spawn_drained(argv, 'pipeline', stdout=write_fd, env=env)
+                self._stderr_tasks.append(task)
+            finally:
+                os.close(read_fd)
+                os.close(write_fd)
+        else:
+            self._ff_proc, task = await _spawn_drained(argv, 'pipeline', env=env)
+            self._stderr_tasks.append(task)
+
+        procs = {'pipeline': self._ff_proc}
+        if self._rtp_proc is not None:
+            procs['packetizer'] = self._rtp_proc
+        if not await _exited_early(procs.values()):
+            return True
+
+        for name, proc in procs.items():
+            if proc.returncode is not None:
+                decky.logger.error(f"Stream {name} exited with code {proc.returncode}")
+        await self._stop_pipeline()
+        return False
+
+    # Stop the fused pipeline
+    async def _stop_pipeline(self):
+        """Terminate the pipeline ffmpeg process and the packetizer it feeds"""
+        # ffmpeg goes first; the packetizer then drains its pipe and exits on EOF
+        for attr in ('_ff_proc', '_rtp_proc'):
+            proc = getattr(self, attr)
+            if proc is None:
+                continue
+            try:
+                await _terminate_process(proc)
+            finally:
+                setattr(self, attr, None)
+        # The children are gone, so their drainers reach EOF as soon as the last output is logged
+        tasks, self._stderr_tasks = self._stderr_tasks, []
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=0.5)
+            for task in pending:
+                task.cancel()
+        self._stream_encoder = None
+
     # Check if we can capture the screen
     async def check_screen_capture_available(self) -> bool:
         """Check if screen capture is available and working"""
         try:
+            if self._pipewire_capture or self._kms_capture:
+                return True
             return await self.screen_capture.check_capture_available()
         except Exception as e:
             decky.logger.error(f"Error checking screen capture: {e}")
@@ -392,23 +1187,21 @@ class Plugin:
             # Create device object
             device = AirplayDevice(device_name, device_ip)
             
-            # Create temporary video file
-            temp_dir = tempfile.gettempdir()
-            self.temp_video_file = os.path.join(temp_dir, f"airdecky_stream_{int(time.time())}.mp4")
+            pipeline_started = False
+            if self._pipewire_capture or self._kms_capture:
+                # Capture, encode and send in a single process
+                pipeline_started = await self._start_pipeline(device_ip)
+                if not pipeline_started:
+                    decky.logger.warning("Stream pipeline failed to start, falling back to screen capture")
+            if not pipeline_started:
+                # The capture process muxes and sends to the device itself
+                capture_started = await self.screen_capture.start_capture(device_ip)
+                if not capture_started:
+                    return {"success": False, "error": "Failed to start screen capture"}
+                self._stream_encoder = self.screen_capture.encoder
             
-            # Start screen capture
-            capture_started = await self.screen_capture.start_capture(self.temp_video_file)
-            if not capture_started:
-                return {"success": False, "error": "Failed to start screen capture"}
-            
-            # Give capture a moment to start
-            await asyncio.sleep(2)
-            
-            # Start streaming to device
-            stream_started = await self.airplay_streamer.start_stream(device_ip, self.temp_video_file)
-            if not stream_started:
-                await self.screen_capture.stop_capture()
-                return {"success": False, "error": "Failed to start stream to device"}
+            # Keep the RTSP control channel open so status checks need no new handshake
+            await self._open_rtsp_connection(device_ip)
             
             self.current_device = device
             self.streaming = True
@@ -416,9 +1209,10 @@ class Plugin:
             decky.logger.info(f"Started AirPlay stream to {device_name} ({device_ip})")
             
             # Emit event to update UI
-            await decky.emit("streaming_status_changed", {
+            self._schedule_emit({
                 "streaming": True,
-                "device": device_name
+                "device": device_name,
+                "encoder": self._stream_encoder
             })
             
             return {"success": True, "device": device_name}
@@ -426,8 +1220,9 @@ class Plugin:
         except Exception as e:
             decky.logger.error(f"Error starting AirPlay stream: {e}")
             # Clean up on error
+            await self._close_rtsp_connections()
+            await self._stop_pipeline()
             await self.screen_capture.stop_capture()
-            await self.airplay_streamer.stop_stream()
             return {"success": False, "error": str(e)}
 
     # Stop AirPlay streaming
@@ -440,28 +1235,22 @@ class Plugin:
             device_name = self.current_device.name if self.current_device else "Unknown"
             
             # Stop streaming
-            await self.airplay_streamer.stop_stream()
+            await self._close_rtsp_connections()
+            await self._stop_pipeline()
             
             # Stop screen capture
             await self.screen_capture.stop_capture()
             
-            # Clean up temporary file
-            if self.temp_video_file and os.path.exists(self.temp_video_file):
-                try:
-                    os.remove(self.temp_video_file)
-                except:
-                    pass
-                self.temp_video_file = None
-            
             self.streaming = False
             self.current_device = None
             
             decky.logger.info("Stopped AirPlay stream")
             
             # Emit event to update UI
-            await decky.emit("streaming_status_changed", {
+            self._schedule_emit({
                 "streaming": False,
-                "device": None
+                "device": None,
+                "encoder": None
             })
             
             return {"success": True}
@@ -476,23 +1265,29 @@ class Plugin:
         return {
             "streaming": self.streaming,
             "device": self.current_device.name if self.current_device else None,
-            "device_ip": self.current_device.ip if self.current_device else None
+            "device_ip": self.current_device.ip if self.current_device else None,
+            "encoder": self._stream_encoder
         }
 
     # Test network connectivity to a device
     async def test_device_connection(self, device_ip: str) -> bool:
         """Test if we can connect to an AirPlay device"""
         try:
-            # Test multiple AirPlay ports
-            for port in [7000, 5000, 32498]:
-                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                sock.settimeout(3)
-                result = sock.connect_ex((device_ip, port))
-                sock.close()
-                
-                if result == 0:
-                    decky.logger.info(f"Successfully connected to {device_ip}:{port}")
+            # A live control connection already proves the device is reachable
+            conn = self._rtsp_conns.get(device_ip)
+            if conn is not None:
+                reader, writer = conn
+                if not writer.is_closing() and not reader.at_eof():
                     return True
+                # The receiver hung up; forget the connection and probe the ports afresh
+                del self._rtsp_conns[device_ip]
+                writer.close()
+
+            # Test all AirPlay ports at once and stop at the first that accepts
+            port = await _first_open_port(device_ip, CONNECT_TIMEOUT, CONNECT_RETRIES)
+            if port is not None:
+                decky.logger.info(f"Successfully connected to {device_ip}:{port}")
+                return True
                     
             decky.logger.warning(f"Could not connect to {device_ip} on any AirPlay ports")
             return False
@@ -501,35 +1296,50 @@ class Plugin:
             decky.logger.error(f"Error testing connection to {device_ip}: {e}")
             return False
 
+    # Test every discovered device in one call
+    async def test_all(self, ips: List[str]) -> Dict[str, bool]:
+        """Probe devices concurrently, at most 32 at a time, and map each IP to its reachability"""
+        semaphore = asyncio.Semaphore(32)
+
+        async def probe(ip: str) -> Tuple[str, bool]:
+            async with semaphore:
+                return ip, await self.test_device_connection(ip)
+
+        return dict(await asyncio.gather(*[probe(ip) for ip in ips]))
+
+    # Collect the system details that stay fixed for the plugin's lifetime
+    async def _build_static_info(self) -> Dict[str, any]:
+        """Build the system information snapshot served by get_system_info"""
+        info = {
+            "platform": _UNAME.sysname,
+            "kernel": _UNAME.release,
+            "architecture": _UNAME.machine,
+            "display_env": _DISPLAY or "Not set",
+            "wayland_display": _WAYLAND_DISPLAY or "Not set",
+        }
+        
+        # Check for required tools
+        info["available_tools"] = {tool: _tool_path(tool) is not None for tool in SYSTEM_TOOLS}
+        
+        # Check network interfaces straight from the kernel rather than forking ip
+        try:
+            info["network_interfaces"] = "Available" if socket.if_nameindex() else "Not available"
+        except OSError:
+            info["network_interfaces"] = "Not available"
+        
+        return info
+
     # Get system information relevant to AirPlay
-    async def get_system_info(self) -> Dict[str, any]:
+    async def get_system_info(self, refresh: bool = False) -> Dict[str, any]:
         """Get system information for debugging"""
         try:
-            info = {
-                "platform": os.uname().sysname,
-                "kernel": os.uname().release,
-                "architecture": os.uname().machine,
-                "display_env": os.environ.get("DISPLAY", "Not set"),
-                "wayland_display": os.environ.get("WAYLAND_DISPLAY", "Not set"),
-            }
-            
-            # Check for required tools
-            tools_check = {}
-            tools = ['ffmpeg', 'gstreamer-launch-1.0', 'avahi-browse', 'wf-recorder', 'xwininfo']
-            for tool in tools:
-                result = subprocess.run(['which', tool], capture_output=True, text=True)
-                tools_check[tool] = result.returncode == 0
-            
-            info["available_tools"] = tools_check
-            
-            # Check network interfaces
-            try:
-                result = subprocess.run(['ip', 'addr', 'show'], capture_output=True, text=True)
-                info["network_interfaces"] = "Available" if result.returncode == 0 else "Not available"
-            except:
-                info["network_interfaces"] = "Not available"
-            
-            return info
+            if refresh:
+                # Opening the system info panel looks again for tools installed since the last probe
+                _tool_path.cache_clear()
+                self._static_info = None
+            if self._static_info is None:
+                self._static_info = await self._build_static_info()
+            return dict(self._static_info)
             
         except Exception as e:
             decky.logger.error(f"Error getting system info: {e}")
@@ -539,6 +1349,29 @@ class Plugin:
     async def _main(self):
         decky.logger.info("AirDecky plugin started!")
         
+        # Browse for AirPlay services in-process; avahi-browse is the fallback
+        if not await self.mdns_discovery.start():
+            decky.logger.warning("zeroconf not available, using avahi-browse for discovery")
+        
+        # KMS capture needs a DRM card and CAP_SYS_ADMIN, from running as root or from an ffmpeg
+        # given the capability with setcap; hardware encoders keep encoding off the CPU
+        ffmpeg = _tool_path('ffmpeg')
+        self._kms_capture = (
+            ffmpeg is not None
+            and bool(glob.glob('/dev/dri/card[0-9]*'))
+            and (os.geteuid() == 0 or _has_sys_admin_cap(ffmpeg))
+        )
+        # Under gamescope, its PipeWire node hands DMA-BUFs to the encoder without KMS plane grabs;
+        # both probes only wait on child processes, so they run concurrently
+        self._rtp_helper = RTP_PORT > 0 and os.access(RTP_HELPER, os.X_OK)
+        self._encoders, self._pipewire_capture = await asyncio.gather(
+            self._probe_encoders(), self._probe_pipewire_capture(self._rtp_helper)
+        )
+        self.screen_capture.vaapi = 'h264_vaapi' in self._encoders
+        decky.logger.info(f"PipeWire capture: {self._pipewire_capture}, KMS capture: {self._kms_capture}, encoders: {self._encoders}")
+        if self._pipewire_capture or self._kms_capture:
+            self._pipeline_template(self._rtp_helper)
+        
         # Check system compatibility
         system_info = await self.get_system_info()
         decky.logger.info(f"System info: {system_info}")
@@ -554,12 +1387,17 @@ class Plugin:
     async def _unload(self):
         if self.streaming:
             await self.stop_airplay_stream()
+        await self._close_rtsp_connections()
+        await self.mdns_discovery.close()
         decky.logger.info("AirDecky plugin unloaded")
 
     # Function called after `_unload` during uninstall
     async def _uninstall(self):
+        # Nothing may outlive the plugin, even if `_unload` bailed out early
+        await self._stop_pipeline()
+        await self.screen_capture.stop_capture()
+        await self.mdns_discovery.close()
         decky.logger.info("AirDecky plugin uninstalled")
-        pass
 
     # Migrations that should be performed before entering `_main()`.
     async def _migration(self):
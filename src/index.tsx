@@ -20,12 +20,13 @@ import { useState, useEffect } from "react";
 import { FaDesktop, FaWifi, FaStop, FaSearch, FaExclamationTriangle, FaTv } from "react-icons/fa";
 
 // Backend function calls
-const scanAirplayDevices = callable<[], any[]>("scan_airplay_devices");
+const scanAirplayDevices = callable<[force: boolean], any[]>("scan_airplay_devices");
 const startAirplayStream = callable<[deviceIp: string, deviceName: string], any>("start_airplay_stream");
 const stopAirplayStream = callable<[], any>("stop_airplay_stream");
 const getStreamingStatus = callable<[], any>("get_streaming_status");
 const testDeviceConnection = callable<[deviceIp: string], boolean>("test_device_connection");
-const getSystemInfo = callable<[], any>("get_system_info");
+const testAll = callable<[ips: string[]], Record<string, boolean>>("test_all");
+const getSystemInfo = callable<[refresh: boolean], any>("get_system_info");
 const checkScreenCaptureAvailable = callable<[], boolean>("check_screen_capture_available");
 
 // Device selection modal
@@ -134,7 +135,7 @@ function SystemInfoModal({ onClose }: any) {
   useEffect(() => {
     const loadSystemInfo = async () => {
       try {
-        const info = await getSystemInfo();
+        const info = await getSystemInfo(true);
         setSystemInfo(info);
       } catch (error) {
         console.error("Error loading system info:", error);
@@ -180,8 +181,10 @@ function SystemInfoModal({ onClose }: any) {
 // Main plugin content
 function Content() {
   const [devices, setDevices] = useState<any[]>([]);
+  const [reachable, setReachable] = useState<Record<string, boolean>>({});
   const [streaming, setStreaming] = useState(false);
   const [currentDevice, setCurrentDevice] = useState<string | null>(null);
+  const [encoder, setEncoder] = useState<string | null>(null);
   const [scanning, setScanning] = useState(false);
   const [screenCaptureAvailable, setScreenCaptureAvailable] = useState(false);
 
@@ -192,6 +195,7 @@ function Content() {
         const status = await getStreamingStatus();
         setStreaming(status.streaming);
         setCurrentDevice(status.device);
+        setEncoder(status.encoder);
 
         const captureAvailable = await checkScreenCaptureAvailable();
         setScreenCaptureAvailable(captureAvailable);
@@ -201,10 +205,25 @@ function Content() {
     };
     loadStatus();
 
+    // Opening the panel fills the list through the backend scan cache, so reopening it needs no new sweep
+    const loadDevices = async () => {
+      try {
+        const cachedDevices = await scanAirplayDevices(false);
+        if (cachedDevices.length > 0) {
+          setDevices(cachedDevices);
+          setReachable(await testAll(cachedDevices.map((device) => device.ip)));
+        }
+      } catch (error) {
+        console.error("Error loading devices:", error);
+      }
+    };
+    loadDevices();
+
     // Listen for streaming status changes
     const handleStreamingStatus = (data: any) => {
       setStreaming(data.streaming);
       setCurrentDevice(data.device);
+      setEncoder(data.encoder);
     };
 
     addEventListener("streaming_status_changed", handleStreamingStatus);
@@ -214,8 +233,10 @@ function Content() {
   const handleScanDevices = async () => {
     setScanning(true);
     try {
-      const foundDevices = await scanAirplayDevices();
+      // An explicit scan always looks afresh instead of reading the backend cache
+      const foundDevices = await scanAirplayDevices(true);
       setDevices(foundDevices);
+      setReachable(foundDevices.length > 0 ? await testAll(foundDevices.map((device) => device.ip)) : {});
       
       if (foundDevices.length === 0) {
         toaster.toast({
@@ -357,6 +378,11 @@ function Content() {
                   Connected to: {currentDevice}
                 </div>
               )}
+              {streaming && encoder && (
+                <div style={{ fontSize: "12px", color: "#aaa" }}>
+                  Encoder: {encoder}
+                </div>
+              )}
             </div>
           </div>
         </PanelSectionRow>
@@ -416,6 +442,7 @@ function Content() {
                   <div style={{ fontWeight: "bold" }}>{device.name}</div>
                   <div style={{ fontSize: "12px", color: "#aaa" }}>
                     {device.ip} • {device.type}
+                    {reachable[device.ip] === false && " • Unreachable"}
                   </div>
                 </div>
                 {!streaming && (